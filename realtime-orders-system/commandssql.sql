@@ -37,13 +37,8 @@ FROM orders WHERE customer_name = 'Rishabh Oswal' ORDER BY created_at;
 -- 10. Show all current orders (final state)
 SELECT id, customer_name, product_name, status, updated_at FROM orders ORDER BY updated_at DESC;
 
--- 11. Show change log focusing on Rishabh's activities
-SELECT oc.id, oc.order_id, oc.operation_type, oc.changed_at, o.customer_name, o.product_name
-FROM order_changes oc
-LEFT JOIN orders o ON oc.order_id = o.id
-WHERE o.customer_name = 'Rishabh Oswal' OR oc.new_data LIKE '%Rishabh Oswal%' OR oc.old_data LIKE '%Rishabh Oswal%'
-ORDER BY oc.changed_at DESC LIMIT 10;
-
--- 12. Show complete audit trail (all recent changes)
-SELECT id, order_id, operation_type, changed_at FROM order_changes 
-ORDER BY changed_at DESC LIMIT 15;
\ No newline at end of file
+-- 11. Show the binlog position each event listener has processed up to
+SELECT server_id, log_file, log_pos, updated_at FROM binlog_checkpoint;
+
+-- 12. Compare with the server's current binlog position
+SHOW MASTER STATUS;
\ No newline at end of file
@@ -1,36 +1,68 @@
 """Configuration management for the real-time orders system."""
 
 import os
-from typing import Optional
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+@dataclass(frozen=True, slots=True)
 class Config:
-    """Application configuration class."""
+    """Application configuration, read from the environment once at import."""
     
     # Database settings
-    DB_HOST: str = os.getenv("DB_HOST", "localhost")
-    DB_PORT: int = int(os.getenv("DB_PORT", "3306"))
-    DB_USER: str = os.getenv("DB_USER", "root")
-    DB_PASSWORD: str = os.getenv("DB_PASSWORD", "")
-    DB_NAME: str = os.getenv("DB_NAME", "realtime_orders")
+    DB_HOST: str
+    DB_PORT: int
+    DB_USER: str
+    DB_PASSWORD: str
+    DB_NAME: str
+    DB_POOL_MIN: int
+    DB_POOL_MAX: int
     
     # Server settings
-    SERVER_HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
-    SERVER_PORT: int = int(os.getenv("SERVER_PORT", "8000"))
+    SERVER_HOST: str
+    SERVER_PORT: int
+    WS_PER_MESSAGE_DEFLATE: bool
     
-    # Polling settings
-    CHANGE_LOG_POLL_INTERVAL: float = float(os.getenv("CHANGE_LOG_POLL_INTERVAL", "0.5"))
+    # Binlog replication settings
+    BINLOG_SERVER_ID: int
+    BINLOG_HEARTBEAT_INTERVAL: float
+    BINLOG_CHECKPOINT_INTERVAL: float
     
     # Logging
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVEL: str
     
-    @property
-    def database_url(self) -> str:
-        """Get the database connection URL."""
-        return f"mysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+    # Derived settings
+    database_url: str
+    
+    @classmethod
+    def _load(cls) -> 'Config':
+        """Build the configuration from environment variables."""
+        env = os.environ
+        db_host = env.get("DB_HOST", "localhost")
+        db_port = int(env.get("DB_PORT", "3306"))
+        db_user = env.get("DB_USER", "root")
+        db_password = env.get("DB_PASSWORD", "")
+        db_name = env.get("DB_NAME", "realtime_orders")
+        
+        return cls(
+            DB_HOST=db_host,
+            DB_PORT=db_port,
+            DB_USER=db_user,
+            DB_PASSWORD=db_password,
+            DB_NAME=db_name,
+            DB_POOL_MIN=int(env.get("DB_POOL_MIN", "25")),
+            DB_POOL_MAX=int(env.get("DB_POOL_MAX", "25")),
+            SERVER_HOST=env.get("SERVER_HOST", "0.0.0.0"),
+            SERVER_PORT=int(env.get("SERVER_PORT", "8000")),
+            WS_PER_MESSAGE_DEFLATE=env.get("WS_PER_MESSAGE_DEFLATE", "false").lower() in ("1", "true", "yes"),
+            BINLOG_SERVER_ID=int(env.get("BINLOG_SERVER_ID", "100")),
+            BINLOG_HEARTBEAT_INTERVAL=float(env.get("BINLOG_HEARTBEAT_INTERVAL", "1.0")),
+            BINLOG_CHECKPOINT_INTERVAL=float(env.get("BINLOG_CHECKPOINT_INTERVAL", "5.0")),
+            LOG_LEVEL=env.get("LOG_LEVEL", "INFO"),
+            database_url=f"mysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+        )
     
     def validate(self) -> None:
         """Validate required configuration."""
@@ -45,4 +77,4 @@ class Config:
             raise ValueError(f"Missing required configuration: {', '.join(missing_fields)}")
 
 # Global configuration instance
-config = Config()
\ No newline at end of file
+config = Config._load()
\ No newline at end of file
@@ -2,42 +2,67 @@
 
 import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+from types import MappingProxyType
+from dataclasses import fields
+from datetime import timedelta, timezone, tzinfo
+from typing import Optional, Dict, Any, List, Mapping, Tuple, Type, TypeVar
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import aiomysql
 from config import config
+from models import OrderRow
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
+# Explicit column list so positional rows line up with OrderRow fields
+_ORDER_COLUMNS = ', '.join(field.name for field in fields(OrderRow))
+
+# Connection parameters are fixed for the life of the process
+_CONNECTION_PARAMS: Mapping[str, Any] = MappingProxyType({
+    'host': config.DB_HOST,
+    'port': config.DB_PORT,
+    'user': config.DB_USER,
+    'password': config.DB_PASSWORD,
+    'db': config.DB_NAME,
+    'charset': 'utf8mb4',
+    'autocommit': True
+})
+
+# Server settings the binlog listener depends on to see complete, named rows
+_REQUIRED_BINLOG_SETTINGS: Mapping[str, str] = MappingProxyType({
+    'log_bin': 'ON',
+    'binlog_format': 'ROW',
+    'binlog_row_image': 'FULL',
+    'binlog_row_metadata': 'FULL'
+})
+
 class DatabaseManager:
     """Manages database connections and operations."""
     
     def __init__(self):
         self.pool: Optional[aiomysql.Pool] = None
-        self._connection_params = {
-            'host': config.DB_HOST,
-            'port': config.DB_PORT,
-            'user': config.DB_USER,
-            'password': config.DB_PASSWORD,
-            'db': config.DB_NAME,
-            'charset': 'utf8mb4',
-            'autocommit': True
-        }
+        self._connection_params = _CONNECTION_PARAMS
     
     async def initialize(self) -> None:
         """Initialize the database connection pool."""
         try:
+            # create_pool opens minsize connections before returning, so with
+            # min == max the whole pool is connected before requests arrive
             self.pool = await aiomysql.create_pool(
-                minsize=5,
-                maxsize=20,
+                minsize=config.DB_POOL_MIN,
+                maxsize=config.DB_POOL_MAX,
+                pool_recycle=3600,
                 **self._connection_params
             )
-            logger.info("Database connection pool initialized")
+            logger.info("Database connection pool initialized with %d connections", self.pool.size)
             
             # Test connection
             await self.health_check()
+            await self.check_binlog_settings()
             
         except Exception as e:
-            logger.error(f"Failed to initialize database pool: {e}")
+            logger.error("Failed to initialize database pool: %s", e)
             raise
     
     async def close(self) -> None:
@@ -56,9 +81,43 @@ class DatabaseManager:
                     result = await cursor.fetchone()
                     return result[0] == 1
         except Exception as e:
-            logger.error(f"Database health check failed: {e}")
+            logger.error("Database health check failed: %s", e)
             return False
     
+    async def check_binlog_settings(self) -> bool:
+        """Warn about server binlog settings that would hide or garble order changes."""
+        names = ', '.join(f"'{name}'" for name in _REQUIRED_BINLOG_SETTINGS)
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f"SHOW VARIABLES WHERE Variable_name IN ({names})")
+                actual = dict(await cursor.fetchall())
+        
+        ok = True
+        for name, expected in _REQUIRED_BINLOG_SETTINGS.items():
+            value = actual.get(name)
+            if value is None or value.upper() != expected:
+                logger.warning("MySQL %s is %s, expected %s; order changes may be missed", name, value or 'unset', expected)
+                ok = False
+        return ok
+    
+    async def get_time_zone(self) -> tzinfo:
+        """Get the time zone that sessions of this pool report TIMESTAMP columns in.
+        
+        Named zones are resolved with their DST rules; SYSTEM and fixed
+        offsets become the server's current UTC offset.
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT @@session.time_zone, TIMESTAMPDIFF(SECOND, UTC_TIMESTAMP(), NOW())")
+                name, offset = await cursor.fetchone()
+        
+        if name != 'SYSTEM' and not name.startswith(('+', '-')):
+            try:
+                return ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.warning("MySQL time zone %s is unknown here, using its current offset", name)
+        return timezone(timedelta(seconds=offset))
+    
     async def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
         """Execute a SELECT query and return results."""
         async with self.pool.acquire() as conn:
@@ -66,6 +125,13 @@ class DatabaseManager:
                 await cursor.execute(query, params)
                 return await cursor.fetchall()
     
+    async def execute_query_as(self, query: str, params: Optional[tuple], row_cls: Type[T]) -> List[T]:
+        """Execute a SELECT query and build a row_cls instance from each row's columns in order."""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, params)
+                return [row_cls(*row) for row in await cursor.fetchall()]
+    
     async def execute_update(self, query: str, params: tuple = None) -> int:
         """Execute an INSERT/UPDATE/DELETE query and return affected rows."""
         async with self.pool.acquire() as conn:
@@ -73,27 +139,22 @@ class DatabaseManager:
                 await cursor.execute(query, params)
                 return cursor.rowcount
     
-    async def get_unprocessed_changes(self) -> List[Dict[str, Any]]:
-        """Fetch unprocessed changes from the change log."""
+    async def get_binlog_position(self) -> Optional[Tuple[str, int]]:
+        """Fetch the last checkpointed binlog position for this listener."""
+        query = "SELECT log_file, log_pos FROM binlog_checkpoint WHERE server_id = %s"
+        results = await self.execute_query(query, (config.BINLOG_SERVER_ID,))
+        return (results[0]['log_file'], results[0]['log_pos']) if results else None
+    
+    async def save_binlog_position(self, log_file: str, log_pos: int) -> None:
+        """Persist the binlog position up to which this listener has processed changes."""
         query = """
-        SELECT id, order_id, operation_type, old_data, new_data, changed_at
-        FROM order_changes 
-        WHERE processed = FALSE 
-        ORDER BY changed_at ASC, id ASC
-        LIMIT 100
+        INSERT INTO binlog_checkpoint (server_id, log_file, log_pos) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE log_file = VALUES(log_file), log_pos = VALUES(log_pos)
         """
-        return await self.execute_query(query)
-    
-    async def mark_changes_processed(self, change_ids: List[int]) -> None:
-        """Mark changes as processed."""
-        if not change_ids:
-            return
+        await self.execute_update(query, (config.BINLOG_SERVER_ID, log_file, log_pos))
         
-        placeholders = ','.join(['%s'] * len(change_ids))
-        query = f"UPDATE order_changes SET processed = TRUE WHERE id IN ({placeholders})"
-        await self.execute_update(query, tuple(change_ids))
-        
-        logger.debug(f"Marked {len(change_ids)} changes as processed")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Checkpointed binlog position %s:%d", log_file, log_pos)
     
     async def get_order_by_id(self, order_id: int) -> Optional[Dict[str, Any]]:
         """Get a specific order by ID."""
@@ -101,6 +162,18 @@ class DatabaseManager:
         results = await self.execute_query(query, (order_id,))
         return results[0] if results else None
     
+    async def get_orders_by_ids(self, order_ids: List[int]) -> Dict[int, OrderRow]:
+        """Get several orders in a single query, keyed by ID."""
+        if not order_ids:
+            return {}
+        
+        # Coercing to int makes inlining the ids safe and spares the driver
+        # from escaping and interpolating one parameter per id
+        ids = (*map(int, order_ids),)
+        query = f"SELECT {_ORDER_COLUMNS} FROM orders WHERE id IN ({','.join(map(str, ids))})"
+        results = await self.execute_query_as(query, None, OrderRow)
+        return {row.id: row for row in results}
+    
     async def get_all_orders(self) -> List[Dict[str, Any]]:
         """Get all orders."""
         query = "SELECT * FROM orders ORDER BY updated_at DESC"
@@ -1,34 +1,61 @@
 """Event listener service for monitoring database changes."""
 
 import asyncio
+import itertools
 import logging
-from typing import List, Callable, Awaitable
-from datetime import datetime
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+from datetime import datetime, timedelta, tzinfo
 
+from pymysqlreplication.event import HeartbeatLogEvent, XidEvent
+
+from binlog_reader import BinlogReader, ROW_EVENT_OPERATIONS, timestamp_columns
 from database.connection import db_manager
-from models import OrderChange, OrderChangeNotification, Order
+from models import OrderChangeNotification, OrderChangeRecord, OrderRow, Order, encode_order_change
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# Window reported by recent_changes_count()
+RECENT_CHANGES_WINDOW = timedelta(hours=1)
+
+# How often the server time zone is re-read, so a SYSTEM zone's UTC offset
+# follows DST changes
+TIME_ZONE_REFRESH_INTERVAL = 60.0
+
+# Columns a binlog row image must carry (by name, with values) to stand in
+# for a fetched order
+ORDER_FIELDS = frozenset(Order.model_fields)
+
 class EventListener:
-    """Listens for database changes and notifies subscribers."""
+    """Streams order changes from the binlog and notifies subscribers."""
     
     def __init__(self):
-        self.subscribers: List[Callable[[OrderChangeNotification], Awaitable[None]]] = []
+        # Rebuilt on (rare) subscribe/unsubscribe so notifying never needs a copy
+        self.subscribers: Tuple[Callable[[OrderChangeNotification], Awaitable[None]], ...] = ()
         self.running = False
         self._task: asyncio.Task = None
+        self._change_ids = itertools.count(1)
+        self._position: Optional[Tuple[str, int]] = None
+        self._saved_position: Optional[Tuple[str, int]] = None
+        self._last_checkpoint = 0.0
+        self._recent_changes: Deque[datetime] = deque()
+        self._time_zone: Optional[tzinfo] = None
+        self._time_zone_checked = 0.0
     
     def subscribe(self, callback: Callable[[OrderChangeNotification], Awaitable[None]]) -> None:
         """Subscribe to order change notifications."""
-        self.subscribers.append(callback)
-        logger.info(f"New subscriber added. Total subscribers: {len(self.subscribers)}")
+        self.subscribers = self.subscribers + (callback,)
+        logger.info("New subscriber added. Total subscribers: %d", len(self.subscribers))
     
     def unsubscribe(self, callback: Callable[[OrderChangeNotification], Awaitable[None]]) -> None:
         """Unsubscribe from order change notifications."""
         if callback in self.subscribers:
-            self.subscribers.remove(callback)
-            logger.info(f"Subscriber removed. Total subscribers: {len(self.subscribers)}")
+            subscribers = list(self.subscribers)
+            subscribers.remove(callback)
+            self.subscribers = tuple(subscribers)
+            logger.info("Subscriber removed. Total subscribers: %d", len(self.subscribers))
     
     async def start(self) -> None:
         """Start the event listener."""
@@ -57,55 +84,149 @@ class EventListener:
     
     async def _listen_loop(self) -> None:
         """Main listening loop."""
-        logger.info("Starting change detection loop")
+        logger.info("Starting binlog change stream")
         
-        while self.running:
-            try:
-                # Fetch unprocessed changes
-                changes = await db_manager.get_unprocessed_changes()
-                
-                if changes:
-                    logger.info(f"Processing {len(changes)} new changes")
-                    
-                    # Process each change
-                    processed_ids = []
-                    for change_row in changes:
-                        try:
-                            change = OrderChange.from_db_row(change_row)
-                            notification = await self._create_notification(change)
-                            
-                            # Notify all subscribers
-                            await self._notify_subscribers(notification)
-                            processed_ids.append(change.id)
-                            
-                        except Exception as e:
-                            logger.error(f"Error processing change {change_row.get('id')}: {e}")
+        try:
+            while self.running:
+                reader = None
+                try:
+                    # Resume from the last committed position, or from the current binlog head
+                    position = self._position or await db_manager.get_binlog_position()
+                    await self._refresh_time_zone()
+                    reader = BinlogReader(*position) if position else BinlogReader()
                     
-                    # Mark changes as processed
-                    if processed_ids:
-                        await db_manager.mark_changes_processed(processed_ids)
+                    async for event in reader:
+                        if isinstance(event, XidEvent):
+                            # Transaction committed; safe point to resume from
+                            self._position = reader.position
+                        elif not isinstance(event, HeartbeatLogEvent):
+                            await self._process_rows_event(event)
+                        
+                        self._prune_recent_changes()
+                        await self._checkpoint()
+                        await self._refresh_time_zone()
+                
+                except asyncio.CancelledError:
+                    logger.info("Event listener cancelled")
+                    break
+                except Exception as e:
+                    logger.error("Error in event listener loop: %s", e)
+                    await asyncio.sleep(1)  # Brief pause before retry
+                finally:
+                    if reader:
+                        reader.close()
+        finally:
+            # Also reached when stop() cancels the retry pause after an error
+            await self._checkpoint(force=True)
+    
+    async def _process_rows_event(self, event) -> None:
+        """Notify subscribers of every row in a binlog row event."""
+        operation_type = ROW_EVENT_OPERATIONS[type(event)]
+        # Commit time in the server zone like the row images; the recent
+        # changes window is kept in this host's time, like datetime.now()
+        committed_at = datetime.fromtimestamp(event.timestamp)
+        changed_at = datetime.fromtimestamp(event.timestamp, self._time_zone).replace(tzinfo=None)
+        
+        logger.info("Processing %d new changes", len(event.rows))
+        
+        # TIMESTAMP values are shifted to the zone initial_data and fetched
+        # orders report them in
+        columns = timestamp_columns(event)
+        time_zone = self._time_zone
+        
+        # Parse all rows first so any order data missing from the row images
+        # can be fetched in one query
+        changes = []
+        for row in event.rows:
+            try:
+                changes.append(OrderChangeRecord.from_binlog_row(next(self._change_ids), operation_type, row, changed_at, columns, time_zone))
+            except Exception as e:
+                logger.error("Error parsing %s change: %s", operation_type, e)
+        
+        order_ids = {
+            change.order_id for change in changes
+            if change.operation_type in ('INSERT', 'UPDATE') and not self._has_order_columns(change.new_data)
+        }
+        orders = await db_manager.get_orders_by_ids(list(order_ids)) if order_ids else {}
+        
+        for change in changes:
+            try:
+                notification = self._create_notification(change, orders)
                 
-                # Wait before next poll
-                await asyncio.sleep(config.CHANGE_LOG_POLL_INTERVAL)
+                # Notify all subscribers
+                await self._notify_subscribers(notification)
+                self._recent_changes.append(committed_at)
                 
-            except asyncio.CancelledError:
-                logger.info("Event listener cancelled")
-                break
             except Exception as e:
-                logger.error(f"Error in event listener loop: {e}")
-                await asyncio.sleep(1)  # Brief pause before retry
+                logger.error("Error processing change %d: %s", change.id, e)
     
-    async def _create_notification(self, change: OrderChange) -> OrderChangeNotification:
-        """Create a notification from a change event."""
+    def recent_changes_count(self) -> int:
+        """Get the number of changes processed within the last hour."""
+        self._prune_recent_changes()
+        return len(self._recent_changes)
+    
+    def _prune_recent_changes(self) -> None:
+        """Drop processed-change timestamps that have left the window."""
+        cutoff = datetime.now() - RECENT_CHANGES_WINDOW
+        recent_changes = self._recent_changes
+        while recent_changes and recent_changes[0] < cutoff:
+            recent_changes.popleft()
+    
+    async def _checkpoint(self, force: bool = False) -> None:
+        """Persist the last committed binlog position at most once per interval."""
+        if self._position is None or self._position == self._saved_position:
+            return
+        
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint < config.BINLOG_CHECKPOINT_INTERVAL:
+            return
+        
+        try:
+            await db_manager.save_binlog_position(*self._position)
+            self._saved_position = self._position
+            self._last_checkpoint = now
+        except Exception as e:
+            logger.error("Error saving binlog checkpoint: %s", e)
+    
+    async def _refresh_time_zone(self) -> None:
+        """Re-read the server time zone at most once per interval."""
+        now = time.monotonic()
+        if self._time_zone is not None and now - self._time_zone_checked < TIME_ZONE_REFRESH_INTERVAL:
+            return
+        
+        self._time_zone_checked = now
+        try:
+            self._time_zone = await db_manager.get_time_zone()
+        except Exception as e:
+            # Without any zone, row images cannot be converted; retry the stream
+            if self._time_zone is None:
+                raise
+            logger.error("Error refreshing server time zone: %s", e)
+    
+    @staticmethod
+    def _has_order_columns(row: Optional[Dict[str, Any]]) -> bool:
+        """Check whether a binlog row image holds a value for every Order column by name."""
+        return row is not None and all(row.get(field) is not None for field in ORDER_FIELDS)
+    
+    def _create_notification(self, change: OrderChangeRecord, orders: Dict[int, OrderRow]) -> OrderChangeNotification:
+        """Create a notification from a change event and prefetched order rows."""
         order_data = None
         
-        # For INSERT and UPDATE, get current order data
+        # For INSERT and UPDATE, attach the committed row image; it comes typed
+        # from MySQL, so it is not validated again. Images without column names
+        # (binlog_row_metadata not FULL) or with columns left out
+        # (binlog_row_image not FULL) fall back to the prefetched order.
         if change.operation_type in ['INSERT', 'UPDATE']:
-            order_row = await db_manager.get_order_by_id(change.order_id)
-            if order_row:
-                order_data = Order(**order_row)
+            if self._has_order_columns(change.new_data):
+                order_data = Order.model_construct(**change.new_data)
+            else:
+                order_row = orders.get(change.order_id)
+                if order_row:
+                    order_data = Order.model_validate(order_row, from_attributes=True)
         
-        return OrderChangeNotification(
+        # Every field comes from the binlog or an already built Order, so the
+        # outbound notification skips validation
+        notification = OrderChangeNotification.model_construct(
             change_id=change.id,
             order_id=change.order_id,
             operation=change.operation_type,
@@ -113,29 +234,33 @@ class EventListener:
             previous_data=change.old_data,
             timestamp=change.changed_at
         )
+        
+        # Serialize once here rather than once per subscriber
+        notification.encoded = encode_order_change(notification)
+        return notification
     
     async def _notify_subscribers(self, notification: OrderChangeNotification) -> None:
         """Notify all subscribers of a change."""
-        if not self.subscribers:
+        subscribers = self.subscribers
+        if not subscribers:
             return
         
-        # Notify all subscribers concurrently
-        tasks = []
-        for subscriber in self.subscribers.copy():  # Copy to avoid modification during iteration
-            try:
-                task = asyncio.create_task(subscriber(notification))
-                tasks.append(task)
-            except Exception as e:
-                logger.error(f"Error creating notification task: {e}")
-        
-        if tasks:
-            # Wait for all notifications to complete
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Log any errors
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    logger.error(f"Error notifying subscriber {i}: {result}")
+        # The usual single subscriber is awaited directly, without a task
+        if len(subscribers) == 1:
+            await self._notify_subscriber(0, subscribers[0], notification)
+            return
+        
+        # Notify all subscribers concurrently and wait for all of them
+        async with asyncio.TaskGroup() as tg:
+            for i, subscriber in enumerate(subscribers):
+                tg.create_task(self._notify_subscriber(i, subscriber, notification))
+    
+    async def _notify_subscriber(self, index: int, subscriber: Callable[[OrderChangeNotification], Awaitable[None]], notification: OrderChangeNotification) -> None:
+        """Notify one subscriber, logging its errors so the others are not cancelled."""
+        try:
+            await subscriber(notification)
+        except Exception as e:
+            logger.error("Error notifying subscriber %d: %s", index, e)
 
 # Global event listener instance
 event_listener = EventListener()
\ No newline at end of file
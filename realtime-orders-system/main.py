@@ -6,6 +6,7 @@ import signal
 import sys
 from contextlib import asynccontextmanager
 
+import orjson
 import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.responses import HTMLResponse
@@ -15,7 +16,6 @@ from config import config
 from database.connection import db_manager
 from event_listener import event_listener
 from websocket_manager import websocket_manager
-from models import WebSocketMessage
 
 # Configure logging
 logging.basicConfig(
@@ -28,7 +28,8 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
     # Startup
-    logger.info("Starting Real-Time Orders System")
+    loop = asyncio.get_running_loop()
+    logger.info(f"Starting Real-Time Orders System on {type(loop).__module__}.{type(loop).__name__}")
     
     try:
         # Validate configuration
@@ -96,24 +97,21 @@ async def heartbeat_loop():
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time order updates."""
-    await websocket_manager.connect(websocket)
-    
     try:
+        await websocket_manager.connect(websocket)
+        
         while True:
             # Keep connection alive and handle client messages
             data = await websocket.receive_text()
             
             # Echo back client messages (for testing)
             try:
-                client_message = eval(data)  # In production, use proper JSON parsing
-                if isinstance(client_message, dict) and client_message.get("type") == "ping":
-                    pong_message = WebSocketMessage(
-                        type="heartbeat",
-                        data={"message": "pong"}
-                    )
-                    await websocket.send_text(pong_message.json())
-            except:
-                pass  # Ignore malformed messages
+                client_message = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                continue  # Ignore malformed messages
+            
+            if isinstance(client_message, dict) and client_message.get("type") == "ping":
+                await websocket_manager.send_pong(websocket)
                 
     except WebSocketDisconnect:
         websocket_manager.disconnect(websocket)
@@ -131,7 +129,7 @@ async def health_check():
             "status": "healthy" if db_healthy else "unhealthy",
             "database": "connected" if db_healthy else "disconnected",
             "event_listener": "running" if event_listener.running else "stopped",
-            "websocket_connections": len(websocket_manager.active_connections),
+            "websocket_connections": websocket_manager.connection_count,
             "timestamp": asyncio.get_event_loop().time()
         }
     except Exception as e:
@@ -144,14 +142,9 @@ async def get_stats():
     try:
         connection_stats = websocket_manager.get_connection_stats()
         
-        # Get recent changes count
-        recent_changes = await db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM order_changes WHERE changed_at > DATE_SUB(NOW(), INTERVAL 1 HOUR)"
-        )
-        
         return {
             "websocket_connections": connection_stats,
-            "recent_changes_last_hour": recent_changes[0]["count"] if recent_changes else 0,
+            "recent_changes_last_hour": event_listener.recent_changes_count(),
             "event_listener_status": "running" if event_listener.running else "stopped"
         }
     except Exception as e:
@@ -220,12 +213,14 @@ CLIENT_HTML = """
     <script>
         let ws;
         let orders = {};
+        const decoder = new TextDecoder();
         
         function connect() {
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
             const wsUrl = `${protocol}//${window.location.host}/ws`;
             
             ws = new WebSocket(wsUrl);
+            ws.binaryType = 'arraybuffer';
             
             ws.onopen = function() {
                 document.getElementById('status').className = 'status connected';
@@ -234,23 +229,11 @@ CLIENT_HTML = """
             };
             
             ws.onmessage = function(event) {
-                const message = JSON.parse(event.data);
-                console.log('Received message:', message);
+                const text = typeof event.data === 'string' ? event.data : decoder.decode(event.data);
+                const parsed = JSON.parse(text);
                 
-                switch(message.type) {
-                    case 'initial_data':
-                        handleInitialData(message.data);
-                        break;
-                    case 'order_change':
-                        handleOrderChange(message.data);
-                        break;
-                    case 'heartbeat':
-                        console.log('Heartbeat received');
-                        break;
-                    case 'error':
-                        console.error('Server error:', message.data);
-                        break;
-                }
+                // Bursts of messages arrive batched in a single array frame
+                (Array.isArray(parsed) ? parsed : [parsed]).forEach(handleMessage);
             };
             
             ws.onclose = function() {
@@ -265,6 +248,25 @@ CLIENT_HTML = """
             };
         }
         
+        function handleMessage(message) {
+            console.log('Received message:', message);
+            
+            switch(message.type) {
+                case 'initial_data':
+                    handleInitialData(message.data);
+                    break;
+                case 'order_change':
+                    handleOrderChange(message.data);
+                    break;
+                case 'heartbeat':
+                    console.log('Heartbeat received');
+                    break;
+                case 'error':
+                    console.error('Server error:', message.data);
+                    break;
+            }
+        }
+        
         function handleInitialData(data) {
             orders = {};
             data.orders.forEach(order => {
@@ -357,11 +359,20 @@ if __name__ == "__main__":
     signal.signal(signal.SIGINT, handle_shutdown)
     signal.signal(signal.SIGTERM, handle_shutdown)
     
-    # Run the server
+    # Run the server on uvloop/httptools where installed (uvloop has no
+    # Windows build, "auto" falls back to asyncio there); per-request access
+    # logging is off since clients hold one long-lived socket each.
+    # permessage-deflate is off by default: it would compress every broadcast
+    # again for each client, with a zlib context per connection.
     uvicorn.run(
         "main:app",
         host=config.SERVER_HOST,
         port=config.SERVER_PORT,
+        loop="auto",
+        http="httptools",
+        ws="websockets",
+        ws_per_message_deflate=config.WS_PER_MESSAGE_DEFLATE,
         log_level=config.LOG_LEVEL.lower(),
+        access_log=False,
         reload=False
     )
\ No newline at end of file
@@ -1,9 +1,12 @@
 """Data models for the real-time orders system."""
 
-from datetime import datetime
-from typing import Optional, Dict, Any, Literal
-from pydantic import BaseModel, Field
-import json
+from dataclasses import dataclass
+from datetime import datetime, timezone, tzinfo
+from typing import Optional, Dict, Any, Literal, Tuple
+import orjson
+import ormsgpack
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic_core import to_jsonable_python
 
 class Order(BaseModel):
     """Order data model."""
@@ -14,10 +17,17 @@ class Order(BaseModel):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    model_config = ConfigDict()
+
+@dataclass(slots=True)
+class OrderRow:
+    """Row of the orders table, built positionally from a tuple cursor."""
+    id: int
+    customer_name: str
+    product_name: str
+    status: str
+    created_at: datetime
+    updated_at: datetime
 
 class OrderChange(BaseModel):
     """Order change event model."""
@@ -28,21 +38,87 @@ class OrderChange(BaseModel):
     new_data: Optional[Dict[str, Any]] = None
     changed_at: datetime
     
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    model_config = ConfigDict()
+
+# Name the replication client gives the first column (orders.id) when the
+# binlog carries no column names, i.e. binlog_row_metadata is not FULL
+UNNAMED_ID_COLUMN = 'UNKNOWN_COL0'
+
+def _binlog_order_id(*images: Optional[Dict[str, Any]]) -> int:
+    """Find the order id in binlog row images, by name or else by position.
+    
+    With binlog_row_image=MINIMAL an image may hold the id column as None,
+    so the first image carrying a value wins.
+    """
+    for image in images:
+        if image:
+            order_id = image.get('id')
+            if order_id is None:
+                order_id = image.get(UNNAMED_ID_COLUMN)
+            if order_id is not None:
+                return order_id
+    raise KeyError('id')
+
+def _localize_timestamps(image: Optional[Dict[str, Any]], columns: Tuple[str, ...], time_zone: tzinfo) -> None:
+    """Convert the TIMESTAMP values of a binlog row image from UTC to time_zone in place.
+    
+    The replication client decodes them as naive UTC, while queries return
+    them in the session time zone; converting makes both paths agree.
+    """
+    if not image:
+        return
+    for column in columns:
+        value = image.get(column)
+        if value is not None:
+            image[column] = value.replace(tzinfo=timezone.utc).astimezone(time_zone).replace(tzinfo=None)
+
+@dataclass(slots=True)
+class OrderChangeRecord:
+    """Unvalidated order change used internally by the event listener.
+    
+    Binlog rows are already typed by MySQL, so these skip the pydantic
+    validation that OrderChange performs.
+    """
+    id: int
+    order_id: int
+    operation_type: str
+    old_data: Optional[Dict[str, Any]]
+    new_data: Optional[Dict[str, Any]]
+    changed_at: datetime
     
     @classmethod
-    def from_db_row(cls, row: Dict[str, Any]) -> 'OrderChange':
-        """Create OrderChange from database row."""
+    def from_binlog_row(
+        cls,
+        change_id: int,
+        operation_type: str,
+        row: Dict[str, Any],
+        changed_at: datetime,
+        timestamp_columns: Tuple[str, ...] = (),
+        time_zone: tzinfo = timezone.utc
+    ) -> 'OrderChangeRecord':
+        """Create OrderChangeRecord from a binlog row event entry.
+        
+        timestamp_columns name the image keys holding TIMESTAMP values, which
+        are shifted to time_zone, the zone queries report them in.
+        """
+        if operation_type == 'UPDATE':
+            old_data, new_data = row['before_values'], row['after_values']
+        elif operation_type == 'DELETE':
+            old_data, new_data = row['values'], None
+        else:
+            old_data, new_data = None, row['values']
+        
+        if timestamp_columns:
+            _localize_timestamps(old_data, timestamp_columns, time_zone)
+            _localize_timestamps(new_data, timestamp_columns, time_zone)
+        
         return cls(
-            id=row['id'],
-            order_id=row['order_id'],
-            operation_type=row['operation_type'],
-            old_data=json.loads(row['old_data']) if row['old_data'] else None,
-            new_data=json.loads(row['new_data']) if row['new_data'] else None,
-            changed_at=row['changed_at']
+            id=change_id,
+            order_id=_binlog_order_id(new_data, old_data),
+            operation_type=operation_type,
+            old_data=old_data,
+            new_data=new_data,
+            changed_at=changed_at
         )
 
 class WebSocketMessage(BaseModel):
@@ -51,10 +127,7 @@ class WebSocketMessage(BaseModel):
     data: Optional[Dict[str, Any]] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    model_config = ConfigDict()
 
 class OrderChangeNotification(BaseModel):
     """Order change notification for WebSocket clients."""
@@ -64,8 +137,58 @@ class OrderChangeNotification(BaseModel):
     order_data: Optional[Order] = None
     previous_data: Optional[Dict[str, Any]] = None
     timestamp: datetime
+    encoded: Optional[bytes] = Field(default=None, exclude=True)
+    
+    model_config = ConfigDict()
+
+# Row images and SELECT * rows may hold values orjson and ormsgpack do not
+# encode natively (DECIMAL, SET, binary); those get pydantic's JSON form
+_default = to_jsonable_python
+
+def encode_ws(message_type: str, data: Optional[Dict[str, Any]] = None) -> bytes:
+    """Encode a message shaped like WebSocketMessage to JSON bytes with orjson.
+    
+    Outbound messages are built by the server, so they are encoded from a
+    plain dict instead of being validated into a WebSocketMessage first.
+    """
+    return orjson.dumps({
+        "type": message_type,
+        "data": data,
+        "timestamp": datetime.utcnow()
+    }, default=_default)
+
+# Fixed frame of an order_change message, in OrderChangeNotification field order
+ORDER_CHANGE_TEMPLATE = (
+    b'{"type":"order_change","data":{"change_id":%d,"order_id":%d,"operation":"%s",'
+    b'"order_data":%s,"previous_data":%s,"timestamp":%s},"timestamp":%s}'
+)
+
+def encode_order_change(notification: OrderChangeNotification) -> bytes:
+    """Encode an order change notification as an order_change WebSocket message.
     
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
\ No newline at end of file
+    The message shape is fixed, so only the variable parts are encoded and
+    filled into ORDER_CHANGE_TEMPLATE; ids are ints and the operation is
+    one of the Literal values, so neither needs escaping.
+    """
+    order_data = notification.order_data
+    return ORDER_CHANGE_TEMPLATE % (
+        notification.change_id,
+        notification.order_id,
+        notification.operation.encode(),
+        orjson.dumps(order_data.model_dump() if order_data is not None else None, default=_default),
+        orjson.dumps(notification.previous_data, default=_default),
+        orjson.dumps(notification.timestamp),
+        orjson.dumps(datetime.utcnow())
+    )
+
+def encode_ws_msgpack(message_type: str, data: Optional[Dict[str, Any]] = None) -> bytes:
+    """Encode a message shaped like WebSocketMessage to MessagePack bytes."""
+    return ormsgpack.packb({
+        "type": message_type,
+        "data": data,
+        "timestamp": datetime.utcnow()
+    }, default=_default)
+
+def encode_order_change_msgpack(notification: OrderChangeNotification) -> bytes:
+    """Encode an order change notification as a MessagePack order_change message."""
+    return encode_ws_msgpack("order_change", notification.model_dump())
\ No newline at end of file
@@ -3,152 +3,384 @@
 import asyncio
 import json
 import logging
-from typing import Set, Dict, Any
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from fastapi import WebSocket, WebSocketDisconnect
 
-from models import WebSocketMessage, OrderChangeNotification, Order
+from models import OrderChangeNotification, Order, encode_order_change, encode_order_change_msgpack, encode_ws, encode_ws_msgpack
 from database.connection import db_manager
 
 logger = logging.getLogger(__name__)
 
+# Per-client outbound queue bound and how many queued messages share a frame
+SEND_QUEUE_SIZE = 1024
+MAX_FRAME_BATCH = 64
+
+# A send that takes longer than this drops the client; at most this many
+# sends are in flight at once across all clients
+SEND_TIMEOUT = 5.0
+MAX_CONCURRENT_SENDS = 256
+
+# The initial snapshot can be large, so a slow link gets longer to take it.
+# Those sends have their own, smaller pool of slots so a reconnect storm of
+# slow links cannot starve the broadcast writers of theirs
+INITIAL_DATA_TIMEOUT = 30.0
+MAX_CONCURRENT_INITIAL_SENDS = 32
+
+# Close code for dropped clients ("try again later"), so they reconnect
+DROPPED_CLOSE_CODE = 1013
+
+# A client whose queue stays full this long is dropped instead of trimmed
+SLOW_CLIENT_TIMEOUT = 2.0
+
+# How long one encoded initial_data snapshot is shared by connecting clients
+SNAPSHOT_TTL = 1.0
+
+# How long order changes are collected before being broadcast together
+COALESCE_WINDOW = 0.005
+
+# Subprotocol clients request to receive MessagePack instead of JSON frames
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+# Heartbeats and pongs only differ in their time, so the rest of the JSON frame is prebuilt
+HEARTBEAT_TEMPLATE = b'{"type":"heartbeat","data":{"server_time":"%s"},"timestamp":"%s"}'
+PONG_TEMPLATE = b'{"type":"heartbeat","data":{"message":"pong"},"timestamp":"%s"}'
+
+def _join_messages(messages: List[bytes]) -> bytes:
+    """Join encoded messages, or arrays of them, into one flat JSON array."""
+    if len(messages) == 1:
+        return messages[0]
+    return b'[' + b','.join(m[1:-1] if m.startswith(b'[') else m for m in messages) + b']'
+
+def _split_msgpack_array(message: bytes) -> Tuple[int, int]:
+    """Get the item count and header size of a MessagePack array, or (1, 0) for a single message."""
+    first = message[0]
+    if 0x90 <= first <= 0x9f:
+        return first & 0x0f, 1
+    if first == 0xdc:
+        return int.from_bytes(message[1:3], 'big'), 3
+    if first == 0xdd:
+        return int.from_bytes(message[1:5], 'big'), 5
+    return 1, 0
+
+def _join_msgpack(messages: List[bytes]) -> bytes:
+    """Join MessagePack messages, or arrays of them, into one flat array."""
+    if len(messages) == 1:
+        return messages[0]
+    
+    # Items are already encoded, so only the array header has to be written
+    count, items = 0, []
+    for message in messages:
+        length, header_size = _split_msgpack_array(message)
+        count += length
+        items.append(message[header_size:] if header_size else message)
+    
+    if count < 0x10:
+        header = bytes((0x90 | count,))
+    elif count < 0x10000:
+        header = b'\xdc' + count.to_bytes(2, 'big')
+    else:
+        header = b'\xdd' + count.to_bytes(4, 'big')
+    return header + b''.join(items)
+
+@dataclass(slots=True)
+class ConnectionInfo:
+    """Per-connection metadata that broadcasting does not touch."""
+    connected_at: datetime
+    client_info: str
+    writer: Optional[asyncio.Task] = None
+    full_since: Optional[float] = None
+    dropped: bool = False
+
 class WebSocketManager:
-    """Manages WebSocket connections and broadcasts."""
+    """Manages WebSocket connections and broadcasts.
+    
+    Per-connection state is kept as parallel lists (one entry per client at
+    the same index), so broadcasting walks the queue list alone; the rest
+    lives in a ConnectionInfo. Removal swaps the last connection into the
+    freed slot.
+    """
     
     def __init__(self):
-        self.active_connections: Set[WebSocket] = set()
-        self.connection_info: Dict[WebSocket, Dict[str, Any]] = {}
+        self._sockets: List[WebSocket] = []
+        self._queues: List[asyncio.Queue] = []
+        self._msgpack: List[bool] = []
+        self._info: List[ConnectionInfo] = []
+        self._columns = (self._sockets, self._queues, self._msgpack, self._info)
+        self._index: Dict[WebSocket, int] = {}
+        self._pending_changes: List[OrderChangeNotification] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._msgpack_connections = 0
+        self._send_slots = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+        self._initial_send_slots = asyncio.Semaphore(MAX_CONCURRENT_INITIAL_SENDS)
+        self._snapshots: Dict[bool, Tuple[float, bytes]] = {}
+        self._snapshot_lock = asyncio.Lock()
+        self._snapshot_generation = 0
+    
+    @property
+    def connection_count(self) -> int:
+        """Get the number of connected clients."""
+        return len(self._sockets)
     
     async def connect(self, websocket: WebSocket) -> None:
-        """Accept a new WebSocket connection."""
-        await websocket.accept()
-        self.active_connections.add(websocket)
+        """Accept a new WebSocket connection, speaking MessagePack if the client asks for it."""
+        use_msgpack = MSGPACK_SUBPROTOCOL in websocket.scope.get('subprotocols', ())
+        await websocket.accept(subprotocol=MSGPACK_SUBPROTOCOL if use_msgpack else None)
+        self._msgpack_connections += use_msgpack
         
-        # Store connection info
-        self.connection_info[websocket] = {
-            'connected_at': datetime.utcnow(),
-            'client_info': websocket.headers.get('user-agent', 'Unknown')
-        }
+        # Register the connection; broadcasts queue up from here on
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._index[websocket] = len(self._sockets)
+        self._sockets.append(websocket)
+        self._queues.append(queue)
+        self._msgpack.append(use_msgpack)
+        self._info.append(ConnectionInfo(datetime.utcnow(), websocket.headers.get('user-agent', 'Unknown')))
         
-        logger.info(f"New WebSocket connection. Total connections: {len(self.active_connections)}")
+        logger.info("New WebSocket connection. Total connections: %d", len(self._sockets))
         
-        # Send initial data to the new client
-        await self._send_initial_data(websocket)
+        # Send initial data first, then start draining changes queued meanwhile.
+        # Until the writer runs nothing else unregisters this client.
+        try:
+            await self._send_initial_data(websocket)
+        except BaseException:
+            self.disconnect(websocket)
+            raise
+        index = self._index.get(websocket)
+        if index is not None:
+            info = self._info[index]
+            info.writer = asyncio.create_task(self._writer_loop(websocket, queue, info))
     
     def disconnect(self, websocket: WebSocket) -> None:
         """Remove a WebSocket connection."""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            self.connection_info.pop(websocket, None)
-            logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+        index = self._index.pop(websocket, None)
+        if index is None:
+            return
+        
+        writer = self._info[index].writer
+        if self._msgpack[index]:
+            self._msgpack_connections -= 1
+        
+        # Move the last connection into the freed slot, then drop the tail
+        last = len(self._sockets) - 1
+        if index != last:
+            for column in self._columns:
+                column[index] = column[last]
+            self._index[self._sockets[index]] = index
+        for column in self._columns:
+            column.pop()
+        
+        if writer and writer is not asyncio.current_task():
+            writer.cancel()
+        logger.debug("WebSocket disconnected. Total connections: %d", len(self._sockets))
     
     async def broadcast_change(self, notification: OrderChangeNotification) -> None:
         """Broadcast an order change to all connected clients."""
-        if not self.active_connections:
+        # Clients connecting from now on must not get a snapshot without it
+        self._snapshots.clear()
+        self._snapshot_generation += 1
+        if not self._sockets:
             return
         
-        message = WebSocketMessage(
-            type="order_change",
-            data={
-                "change_id": notification.change_id,
-                "order_id": notification.order_id,
-                "operation": notification.operation,
-                "order_data": notification.order_data.dict() if notification.order_data else None,
-                "previous_data": notification.previous_data,
-                "timestamp": notification.timestamp.isoformat()
-            }
-        )
+        # Changes arriving within the window are sent to every client as one
+        # array of the same bytes per wire format
+        self._pending_changes.append(notification)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(COALESCE_WINDOW, self._flush_changes)
+    
+    def _flush_changes(self) -> None:
+        """Broadcast the order changes collected during the coalescing window."""
+        changes, self._pending_changes = self._pending_changes, []
+        self._flush_handle = None
+        if not changes or not self._sockets:
+            return
         
-        await self._broadcast_message(message)
-        logger.info(f"Broadcasted {notification.operation} for order {notification.order_id} to {len(self.active_connections)} clients")
+        # The listener already encoded each change as JSON; MessagePack is
+        # only encoded when some client negotiated it
+        self._broadcast_message(
+            _join_messages([change.encoded or encode_order_change(change) for change in changes]),
+            _join_msgpack([encode_order_change_msgpack(change) for change in changes]) if self._msgpack_connections else None
+        )
+        logger.debug("Broadcasted %d order changes to %d clients", len(changes), len(self._sockets))
     
     async def send_heartbeat(self) -> None:
         """Send heartbeat to all connected clients."""
-        if not self.active_connections:
+        if not self._sockets:
             return
         
-        message = WebSocketMessage(
-            type="heartbeat",
-            data={"server_time": datetime.utcnow().isoformat()}
+        now = datetime.utcnow().isoformat()
+        now_bytes = now.encode()
+        self._broadcast_message(
+            HEARTBEAT_TEMPLATE % (now_bytes, now_bytes),
+            encode_ws_msgpack("heartbeat", {"server_time": now}) if self._msgpack_connections else None
         )
+    
+    async def send_pong(self, websocket: WebSocket) -> None:
+        """Answer a client's ping, under the same send limits as broadcasts."""
+        if self.uses_msgpack(websocket):
+            message = encode_ws_msgpack("heartbeat", {"message": "pong"})
+        else:
+            message = PONG_TEMPLATE % datetime.utcnow().isoformat().encode()
         
-        await self._broadcast_message(message)
+        try:
+            await self._send_message(websocket, message)
+        except TimeoutError:
+            logger.warning("Sending pong timed out after %ss, dropping client", SEND_TIMEOUT)
+            self.disconnect(websocket)
+            await self._close_dropped(websocket)
+            raise
+    
+    def uses_msgpack(self, websocket: WebSocket) -> bool:
+        """Check whether a connection negotiated MessagePack frames."""
+        index = self._index.get(websocket)
+        return index is not None and self._msgpack[index]
     
     async def _send_initial_data(self, websocket: WebSocket) -> None:
         """Send initial orders data to a newly connected client."""
+        use_msgpack = self.uses_msgpack(websocket)
         try:
-            orders = await db_manager.get_all_orders()
-            
-            # Convert datetime objects to ISO format
-            orders_data = []
-            for order in orders:
-                order_dict = dict(order)
-                for key, value in order_dict.items():
-                    if isinstance(value, datetime):
-                        order_dict[key] = value.isoformat()
-                orders_data.append(order_dict)
-            
-            message = WebSocketMessage(
-                type="initial_data",
-                data={"orders": orders_data}
-            )
-            
-            await self._send_message(websocket, message)
-            logger.debug(f"Sent initial data with {len(orders)} orders to new client")
+            message = await self._initial_data_snapshot(use_msgpack)
+            await self._send_message(websocket, message, INITIAL_DATA_TIMEOUT, self._initial_send_slots)
+            logger.debug("Sent initial data (%d bytes) to new client", len(message))
             
+        except TimeoutError:
+            # The socket is stalled mid-frame, so an error message would stall too
+            logger.warning("Sending initial data timed out after %ss, dropping client", INITIAL_DATA_TIMEOUT)
+            await self._close_dropped(websocket)
+            raise
         except Exception as e:
-            logger.error(f"Error sending initial data: {e}")
-            error_message = WebSocketMessage(
-                type="error",
-                data={"message": "Failed to load initial data"}
-            )
-            await self._send_message(websocket, error_message)
-    
-    async def _broadcast_message(self, message: WebSocketMessage) -> None:
-        """Broadcast a message to all connected clients."""
-        if not self.active_connections:
-            return
-        
-        message_json = message.json()
-        disconnected_clients = set()
-        
-        # Send to all clients concurrently
-        tasks = []
-        for websocket in self.active_connections.copy():
-            task = asyncio.create_task(self._send_message_safe(websocket, message_json, disconnected_clients))
-            tasks.append(task)
+            logger.error("Error sending initial data: %s", e)
+            encode = encode_ws_msgpack if use_msgpack else encode_ws
+            await self._send_message(websocket, encode("error", {"message": "Failed to load initial data"}), slots=self._initial_send_slots)
+    
+    async def _initial_data_snapshot(self, use_msgpack: bool) -> bytes:
+        """Get the encoded initial_data message, fetched at most once per SNAPSHOT_TTL.
         
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+        Clients connecting together wait on one query and share its bytes.
+        An order change discards the snapshot, and a fetch that overlapped a
+        change is sent but not cached.
+        """
+        async with self._snapshot_lock:
+            cached = self._snapshots.get(use_msgpack)
+            if cached and time.monotonic() - cached[0] < SNAPSHOT_TTL:
+                return cached[1]
+            
+            generation = self._snapshot_generation
+            fetched_at = time.monotonic()
+            orders = await db_manager.get_all_orders()
+            
+            # Rows are plain dicts; orjson and ormsgpack encode datetimes natively
+            encode = encode_ws_msgpack if use_msgpack else encode_ws
+            message = encode("initial_data", {"orders": orders})
+            if generation == self._snapshot_generation:
+                self._snapshots[use_msgpack] = (fetched_at, message)
+            return message
+    
+    def _broadcast_message(self, message_bytes: bytes, msgpack_bytes: Optional[bytes] = None) -> None:
+        """Queue an encoded message for every connected client in its wire format.
         
-        # Clean up disconnected clients
-        for websocket in disconnected_clients:
-            self.disconnect(websocket)
+        msgpack_bytes may only be omitted while no client uses MessagePack.
+        Nothing here awaits or disconnects a client (writers do that in their
+        own tasks), so the connection lists are walked without a copy.
+        """
+        for index, (queue, use_msgpack) in enumerate(zip(self._queues, self._msgpack)):
+            message = msgpack_bytes if use_msgpack else message_bytes
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._handle_slow_client(index, message)
     
-    async def _send_message(self, websocket: WebSocket, message: WebSocketMessage) -> None:
-        """Send a message to a specific WebSocket."""
-        await websocket.send_text(message.json())
+    def _handle_slow_client(self, index: int, message_bytes: bytes) -> None:
+        """Drop the oldest message of a full send queue, or the client once it has been full too long."""
+        info = self._info[index]
+        now = time.monotonic()
+        if info.full_since is None:
+            info.full_since = now
+            logger.warning("Send queue full for %s, dropping oldest messages", info.client_info)
+        elif now - info.full_since > SLOW_CLIENT_TIMEOUT and info.writer and not info.dropped:
+            # The writer disconnects and closes in its own task, so the
+            # broadcast iterating the connection lists is not disturbed
+            logger.warning("Send queue full for %s over %ss, dropping client", info.client_info, SLOW_CLIENT_TIMEOUT)
+            info.dropped = True
+            info.writer.cancel()
+        
+        queue = self._queues[index]
+        queue.get_nowait()
+        queue.put_nowait(message_bytes)
     
-    async def _send_message_safe(self, websocket: WebSocket, message_json: str, disconnected_clients: Set[WebSocket]) -> None:
-        """Safely send a message, handling disconnections."""
+    async def _writer_loop(self, websocket: WebSocket, queue: asyncio.Queue, info: ConnectionInfo) -> None:
+        """Drain a client's queue, sending bursts as one array frame."""
+        join = _join_msgpack if self.uses_msgpack(websocket) else _join_messages
+        dropped = False
         try:
-            await websocket.send_text(message_json)
+            while True:
+                batch = [await queue.get()]
+                while len(batch) < MAX_FRAME_BATCH and not queue.empty():
+                    batch.append(queue.get_nowait())
+                
+                # Caught up with the backlog; the client is no longer lagging
+                if info.full_since is not None and queue.empty():
+                    info.full_since = None
+                
+                await self._send_message(websocket, join(batch))
         except WebSocketDisconnect:
-            disconnected_clients.add(websocket)
+            pass
+        except TimeoutError:
+            logger.warning("Send to WebSocket timed out after %ss, dropping client", SEND_TIMEOUT)
+            dropped = True
+        except asyncio.CancelledError:
+            if not info.dropped:
+                raise
+            # Cancelled by _handle_slow_client; still close the socket below
+            asyncio.current_task().uncancel()
+            dropped = True
         except Exception as e:
-            logger.error(f"Error sending message to WebSocket: {e}")
-            disconnected_clients.add(websocket)
+            logger.error("Error sending message to WebSocket: %s", e)
+        finally:
+            self.disconnect(websocket)
+        
+        # Closing tells the client to reconnect for a fresh snapshot
+        if dropped:
+            await self._close_dropped(websocket)
+    
+    async def _close_dropped(self, websocket: WebSocket) -> None:
+        """Close a dropped client's socket, giving up if it is stalled too."""
+        try:
+            async with asyncio.timeout(SEND_TIMEOUT):
+                await websocket.close(code=DROPPED_CLOSE_CODE)
+        except Exception as e:
+            logger.debug("Error closing dropped WebSocket: %s", e)
+    
+    async def _send_message(
+        self,
+        websocket: WebSocket,
+        message_bytes: bytes,
+        timeout: Optional[float] = None,
+        slots: Optional[asyncio.Semaphore] = None
+    ) -> None:
+        """Send an encoded message to a specific WebSocket.
+        
+        The send holds one of the shared send slots, or of the given slots,
+        and is bounded by SEND_TIMEOUT unless given a timeout.
+        """
+        # Hand the ASGI message to websocket.send directly, skipping the
+        # send_bytes wrapper. The dict is not reused between sends: servers
+        # and test clients may hold on to it after the send returns.
+        async with slots or self._send_slots:
+            async with asyncio.timeout(timeout or SEND_TIMEOUT):
+                await websocket.send({"type": "websocket.send", "bytes": message_bytes})
     
     def get_connection_stats(self) -> Dict[str, Any]:
         """Get statistics about current connections."""
         return {
-            "total_connections": len(self.active_connections),
+            "total_connections": len(self._sockets),
             "connections": [
                 {
-                    "connected_at": info["connected_at"].isoformat(),
-                    "client_info": info["client_info"]
+                    "connected_at": info.connected_at.isoformat(),
+                    "client_info": info.client_info
                 }
-                for info in self.connection_info.values()
+                for info in self._info
             ]
         }
 